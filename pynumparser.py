@@ -59,8 +59,8 @@ Example Usage:
         print('Direct from ("%s"): %s' % (number, num_range))
 """
 
+from collections import Counter, OrderedDict
 import math
-import re
 version = '1.4.1'
 
 description = ('A library to parse arguments of numbers and number ' +
@@ -68,7 +68,60 @@ description = ('A library to parse arguments of numbers and number ' +
                ' concise representation of contiguous or non-contiguous' +
                ' sequences. Example: 1,5-10,40-50/5,200+100/25')
 
-_SEQPATT = re.compile('^(.*[^-+e])([-+])([-+]?[.0-9][^-+]*([Ee][-+]?[0-9]+)?)$')
+
+def _is_upper(text):
+    """Returns true if TEXT has the form of an UPPER (or INCREMENT) term:
+    an optional sign, a digit or '.', and no further sign except one that
+    directly follows the exponent marker of a trailing exponent."""
+    if text.startswith(('-', '+')):
+        text = text[1:]
+    if not text or text[0] not in '.0123456789':
+        return False
+    for i, char in enumerate(text):
+        if char in '-+':
+            exponent = text[i + 1:]
+            return (text[i - 1] in 'Ee' and exponent != '' and
+                    not exponent.strip('0123456789'))
+    return True
+
+
+def _last_sign(text, end):
+    """Return the position of the last '-' or '+' in TEXT before END."""
+    return max(text.rfind('-', 0, end), text.rfind('+', 0, end))
+
+
+def _tokenize(text):
+    """Split TEXT into its subsequences. Yields a (SUBSEQ, LOWER, SEP,
+    UPPER, STEP) tuple of strings for each subsequence; SEP and UPPER are
+    None for a bare number, and STEP is None if no stride was given.
+
+    The separator is the last '-' or '+' before any '/' that is not the
+    first character, does not follow a sign or an exponent marker, and is
+    followed by a valid UPPER term. Only the last such candidate can be
+    followed by a valid UPPER, so it is the only one that is checked.
+    All scanning is done with the (C level) str methods."""
+    for subseq in text.split(','):
+        lowup, slash, step = subseq.partition('/')
+        if not slash:
+            step = None
+        sep = _last_sign(lowup, len(lowup))
+        while sep > 0 and lowup[sep - 1] in '-+eE':
+            sep = _last_sign(lowup, sep)
+        if sep > 0 and _is_upper(lowup[sep + 1:]):
+            yield subseq, lowup[:sep], lowup[sep], lowup[sep + 1:], step
+        else:
+            yield subseq, lowup, None, None, step
+
+
+# Memoized results of NumberSequence.parse(), least recently used first.
+# Only short sequences are kept, so that large results are not pinned.
+_parse_cache = OrderedDict()
+_PARSE_CACHE_SIZE = 256
+_PARSE_CACHE_MAX_LEN = 1024
+
+
+# Prefix of the error messages about a subsequence; only formatted on error.
+_SUBSEQ_TAG = "Subsequence \"{}\": "
 
 
 class NumberSequence(object):
@@ -98,9 +151,30 @@ class NumberSequence(object):
         if numtype not in (int, float):
             raise ValueError("NumberSequence: Invalid numeric type: " +
                              str(numtype))
-        self.lowest, self.highest = limits or (None, None)
+        self._lowest, self._highest = limits or (None, None)
+        self._check = self._make_check(self._lowest, self._highest)
         self.error = None
 
+    # The limits are properties, so that the limit check (and the key of the
+    # parse cache) always follow changes to them.
+    @property
+    def lowest(self):
+        return self._lowest
+
+    @lowest.setter
+    def lowest(self, lowest):
+        self._lowest = lowest
+        self._check = self._make_check(lowest, self._highest)
+
+    @property
+    def highest(self):
+        return self._highest
+
+    @highest.setter
+    def highest(self, highest):
+        self._highest = highest
+        self._check = self._make_check(self._lowest, highest)
+
     def __repr__(self):
         text = self.numtype.__name__.capitalize() + "Sequence"
         if None not in (self.lowest, self.highest):
@@ -124,88 +198,132 @@ class NumberSequence(object):
         raise ValueError("NumberSequence: " + (tag and tag + " ") +
                          (fmt.format(args) if args else fmt))
 
+    @staticmethod
+    def _make_check(lowest, highest):
+        """Returns a function that enforces the given limits on the LOWER and
+        UPPER of a subsequence, or None if there are no limits at all."""
+        def check_lowest(subseq, lower, upper, error):
+            if lower < lowest:
+                error("LOWER too small", _SUBSEQ_TAG.format(subseq) +
+                      "LOWER({}) cannot be less than ({})".format(
+                          lower, lowest))
+
+        def check_highest(subseq, lower, upper, error):
+            if upper > highest:
+                error("UPPER too large", _SUBSEQ_TAG.format(subseq) +
+                      "UPPER({}) cannot be greater than ({})".format(
+                          upper, highest))
+
+        def check_both(subseq, lower, upper, error):
+            check_lowest(subseq, lower, upper, error)
+            check_highest(subseq, lower, upper, error)
+
+        if lowest is None:
+            return None if highest is None else check_highest
+        return check_lowest if highest is None else check_both
+
     def _subsequences(self, text):
-        for nss, subseq in enumerate(text.split(',')):
+        numtype, check = self.numtype, self._check
+        default_step = numtype(1)
+        # Only floats can be infinite.
+        check_inf = numtype is float
+        for nss, (subseq, lower, sep, upper,
+                  step) in enumerate(_tokenize(text)):
             if not subseq:
                 self._error("Empty subsequence",
                             "Subsequence #{} is empty", nss)
-            tag = "Subsequence \"{}\": ".format(subseq)
-            if '/' in subseq:
+            if step is not None:
                 if '-' not in subseq[1:] and '+' not in subseq[1:]:
                     self._error("Missing UPPER",
-                                tag + "STEP w/o UPPER (\"{}\")", subseq)
-                lowup, step = subseq.split('/')
+                                _SUBSEQ_TAG.format(subseq) +
+                                "STEP w/o UPPER (\"{}\")", subseq)
                 try:
-                    step = self.numtype(step)
+                    step = numtype(step)
                 except Exception:
                     self._error("Invalid STEP",
-                                tag + "Invalid STEP(\"{}\")", step)
+                                _SUBSEQ_TAG.format(subseq) +
+                                "Invalid STEP(\"{}\")", step)
                 if step <= 0:
-                    self._error("STEP must be positive", tag +
+                    self._error("STEP must be positive",
+                                _SUBSEQ_TAG.format(subseq) +
                                 "STEP must be positive (\"{}\")".format(step))
             else:
-                lowup, step = subseq, 1
+                step = default_step
 
             # We handle all of: "-5", "2", "-3-5", "-3--1", "3-21",
             # and "1e-5-1.001e-5/1e-8", "-20+10", "-2e+2+1e02"
-            seq = _SEQPATT.match(lowup)
-            if seq:
-                lower, sep, upper = seq.group(1, 2, 3)
+            if sep:
                 try:
-                    lower = self.numtype(lower)
+                    lower = numtype(lower)
                 except ValueError:
-                    self._error("Invalid LOWER", tag +
+                    self._error("Invalid LOWER",
+                                _SUBSEQ_TAG.format(subseq) +
                                 "LOWER({}) is invalid".format(lower))
                 try:
-                    upper = self.numtype(upper)
+                    upper = numtype(upper)
                 except ValueError:
-                    self._error("Invalid UPPER", tag +
+                    self._error("Invalid UPPER",
+                                _SUBSEQ_TAG.format(subseq) +
                                 "UPPER({}) is invalid".format(upper))
                 if sep == '+':
                     upper += lower
                 if upper < lower:
-                    self._error("UPPER<LOWER", tag +
+                    self._error("UPPER<LOWER",
+                                _SUBSEQ_TAG.format(subseq) +
                                 "UPPER({}) is less than LOWER({})".format(
                                     upper, lower))
             else:
                 try:
-                    lower = upper = self.numtype(lowup)
+                    lower = upper = numtype(lower)
                 except ValueError:
                     self._error("Parse Error", "invalid {} value: '{}'".format(
-                        self.numtype.__name__, lowup))
-            if any(map(math.isinf, (lower, upper, step))):
-                self._error("Infinite Value", tag +
+                        numtype.__name__, lower))
+            if check_inf and (math.isinf(lower) or math.isinf(upper) or
+                              math.isinf(step)):
+                self._error("Infinite Value",
+                            _SUBSEQ_TAG.format(subseq) +
                             "Numeric values cannot be infinite ({})".format(
                                 subseq))
-            if self.lowest is not None and lower < self.lowest:
-                self._error("LOWER too small", tag +
-                            "LOWER({}) cannot be less than ({})".format(
-                                lower, self.lowest))
-            if self.highest is not None and upper > self.highest:
-                self._error("UPPER too large", tag +
-                            "UPPER({}) cannot be greater than ({})".format(
-                                upper, self.highest))
+            if check is not None:
+                check(subseq, lower, upper, self._error)
 
-            yield (tag, nss, subseq, lower, upper, step)
+            yield (nss, subseq, lower, upper, step)
 
     def xparse(self, text):
         """This is a generator for the numbers that 'parse()' returns.
         Use this (rather than 'parse()') in the same way you would use
         'xrange()' in lieu of 'range()'."""
         self.error = None
-        for nss, tag, subseq, lower, upper, step in self._subsequences(text):
+        for nss, subseq, lower, upper, step in self._subsequences(text):
             for num in self._range(lower, upper, step):
                 yield num
 
     def contains(self, text, number):
         """Returns true if the given NUMBER is contained in this range."""
+        if not isinstance(number, (tuple, list)):
+            return self._contains(lambda: self._subsequences(text), number)
+
+        # Decode TEXT only once for all numbers. This is done lazily, so
+        # that decoding errors are raised at the same point as before.
+        decoded = []
+        pending = self._subsequences(text)
+
+        def subsequences():
+            for subsequence in decoded:
+                yield subsequence
+            for subsequence in pending:
+                decoded.append(subsequence)
+                yield subsequence
+        return self._contains(subsequences, number)
+
+    def _contains(self, subsequences, number):
         if isinstance(number, (tuple, list)):
-            return tuple(self.contains(text, num) for num in number)
+            return tuple(self._contains(subsequences, num) for num in number)
         try:
             number = self.numtype(number)
         except (TypeError, ValueError):
             return False
-        for nss, tag, subseq, lower, upper, step in self._subsequences(text):
+        for nss, subseq, lower, upper, step in subsequences():
             if number in (lower, upper):
                 return True
             if lower < number and number < upper:
@@ -213,20 +331,81 @@ class NumberSequence(object):
                     return True
                 elif self.numtype == float:
                     # We compare to within 10 PPM (0.001%); arbitrary but good.
-                    epsilon = step / 1e5
-                    if (abs(number - lower + epsilon) % step) < 2 * epsilon:
+                    # fmod() is exact, and unlike the quotient it cannot
+                    # overflow for huge ranges with a tiny step.
+                    remainder = math.fmod(number - lower, step)
+                    if min(remainder, step - remainder) < step / 1e5:
                         return True
         return False
 
     def parse(self, text):
         """This returns a tuple of numbers."""
-        return tuple(self.xparse(text))
+        self.error = None
+        # The result only depends on the numeric type, the limits and TEXT.
+        key = (self.numtype, self._lowest, self._highest, text)
+        try:
+            result = _parse_cache.pop(key)
+        except KeyError:
+            # Errors are raised (and recorded on self) here; never cached.
+            result = self._parse(text)
+            if len(result) > _PARSE_CACHE_MAX_LEN:
+                return result
+            if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+                _parse_cache.popitem(last=False)
+        _parse_cache[key] = result
+        return result
+
+    def _parse(self, text):
+        if self.numtype is not int:
+            return tuple(self.xparse(text))
+        # Integer subsequences map directly onto range(), which avoids
+        # stepping through the numbers one at a time in Python.
+        self.error = None
+        ranges = [range(lower, upper + 1, step) for nss, subseq, lower, upper,
+                  step in self._subsequences(text)]
+        if len(ranges) == 1:
+            # A range knows its length, so tuple() can allocate it at once.
+            return tuple(ranges[0])
+        result = []
+        for numbers in ranges:
+            result.extend(numbers)
+        return tuple(result)
 
     def __call__(self, text):
         if self.generator:
             return self.xparse(text)
         return self.parse(text)
 
+    @staticmethod
+    def _delta(seq, start=1, width=4):
+        """Return the delta that occurs most often in the given SEQ."""
+        seq = seq[start:start + width]
+        if len(seq) < 2:
+            return 1
+        # First order delta.
+        _seq = [seq[i + 1] - seq[i] for i in range(len(seq) - 1)]
+        # Count, and pick the most frequent (then largest) delta.
+        pairs = [(count, i) for i, count in Counter(_seq).items()]
+        pairs.append((2, 1))   # favor '1'
+        return max(pairs)[1]
+
+    @classmethod
+    def _runs(cls, sequence):
+        """Split a non-empty SEQUENCE into runs of a constant step value.
+        This yields a (BASE, LAST, DELTA) tuple for each run."""
+        # Start with the first number, and iterate looking ahead for longer
+        # runs of the same step value.
+        base = last = sequence[0]
+        ndel = cls._delta(sequence, 0)
+        for i, num in enumerate(sequence[1:]):
+            if num == (last + ndel):
+                last += ndel
+                continue
+            yield base, last, ndel
+            ndel = cls._delta(sequence, i + 2)
+            base = last = num
+        yield base, last, ndel
+
     @classmethod
     def encode(cls, sequence):
         """Convert a list/tuple of numbers into a string form. This uses the
@@ -238,49 +417,22 @@ class NumberSequence(object):
         if not sequence:
             return ""
 
-        # Return the delta that occurs most often in the given SEQ.
-        def delta(seq, start=1, width=4):
-            seq = seq[start:start + width]
-            if len(seq) < 2:
-                return 1
-            # First order delta.
-            _seq = [seq[i + 1] - seq[i] for i in range(len(seq) - 1)]
-            # Count and sorted.
-            pairs = [(_seq.count(i), i) for i in set(_seq)]
-            pairs.append((2, 1))   # favor '1'
-            return sorted(pairs, reverse=True)[0][1]
-
-        # Start with the first number, and iterate looking ahead for longer
-        # runs of the same step value.
         result = []
-        base = sequence[0]
-        last = base
-        term = str(base)
-        ndel = delta(sequence, 0)
-        for i, num in enumerate(sequence[1:]):
-            if num == (last + ndel):
-                last += ndel
-                continue
-            # Use "4,5" not "4-5"
-            if last == (base + ndel):
-                result.append(term)
-                term = str(last)
+        runs = list(cls._runs(sequence))
+        for nrun, (base, last, ndel) in enumerate(runs, 1):
+            # Use "4,5" not "4-5" (except for the final run).
+            if last == (base + ndel) and nrun < len(runs):
+                result.append(str(base))
+                result.append(str(last))
 
             # With a "-" and maybe a "/".
             elif last > base:
-                term += "-" + str(last)
+                term = str(base) + "-" + str(last)
                 if ndel != 1:
                     term += "/" + str(ndel)
-            result.append(term)
-            ndel = delta(sequence, i + 2)
-            base = num
-            last = base
-            term = str(base)
-        if last > base:
-            term += "-" + str(last)
-            if ndel != 1:
-                term += "/" + str(ndel)
-        result.append(term)
+                result.append(term)
+            else:
+                result.append(str(base))
         return ",".join(result)
 
 
@@ -0,0 +1,24 @@
+import importlib
+import os
+import sys
+
+
+# Location of test script
+test_script_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def load_source(name, filename):
+    '''
+    Load a module from a source file in the repository root, once per test session.
+    These are not proper modules, so use importlib to load the sources.
+    '''
+    if name not in sys.modules:
+        importlib.machinery.SourceFileLoader(name, os.path.join(test_script_dir, '..', filename)).load_module()
+    return sys.modules[name]
+
+
+# jobinfo imports pynumparser, so that one has to be loaded first.
+load_source('pynumparser', 'pynumparser.py')
+load_source('jobinfo', 'jobinfo')
+# The script that anonymises the test data has its own tests as well.
+load_source('anonymise', os.path.join('test', 'data', 'anonymise.py'))
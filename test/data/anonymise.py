@@ -5,6 +5,12 @@ import random
 import re
 import string
 
+# Use Aho-Corasick multi-pattern matching for the replacements if pyahocorasick is available.
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 
 # Name of the original input files, see README.md for more information on how to generate them.
 SACCT_FILE = 'sacct.txt'
@@ -35,16 +41,14 @@ def random_job_name():
 
 def find_usernames():
     '''Find all usernames in the third column of the sacct dump.'''
+    usernames = set()
     with open(SACCT_FILE, 'rb') as sacct:
-        sacct_lines = sacct.readlines()
-
-    usernames = [
-        line.split(SACCT_SEPARATOR)[SACCT_USERNAMES_COLUMN]
-        for line in sacct_lines
-        if line.split(SACCT_SEPARATOR)[SACCT_USERNAMES_COLUMN]
-    ]
-    # Convert to set to get unique usernames.
-    return set(usernames)
+        for line in sacct:
+            # Only split off the columns up to and including the username.
+            columns = line.split(SACCT_SEPARATOR, SACCT_USERNAMES_COLUMN + 1)
+            if len(columns) > SACCT_USERNAMES_COLUMN and columns[SACCT_USERNAMES_COLUMN]:
+                usernames.add(columns[SACCT_USERNAMES_COLUMN])
+    return usernames
 
 
 def find_cluster_prefixes():
@@ -69,38 +73,90 @@ def generate_anonymised_cluster_prefixes(cluster_prefixes):
     return {prefix: CLUSTER_PREFIX_ANON + b'%d' % (i+1) for i, prefix in enumerate(cluster_prefixes)}
 
 
+def make_replacer(replacements):
+    '''Return a function that replaces all keys of the replacements mapping in a line by their values in a single pass.'''
+    if not replacements:
+        return lambda line: line
+    if ahocorasick is not None:
+        return make_automaton_replacer(replacements)
+    # Try the longest keys first, so that a key that is a prefix of another key cannot shadow it.
+    pattern = re.compile(b'|'.join(re.escape(key) for key in sorted(replacements, key=len, reverse=True)))
+    return lambda line: pattern.sub(lambda match: replacements[match.group(0)], line)
+
+
+def make_automaton_replacer(replacements):
+    '''Return a function like make_replacer does, but find all keys in a single scan with an Aho-Corasick automaton.'''
+    automaton = ahocorasick.Automaton()
+    for key, value in replacements.items():
+        # The automaton works on strings, latin-1 maps every byte to exactly one character.
+        automaton.add_word(key.decode('latin-1'), (len(key), value))
+    automaton.make_automaton()
+
+    def replace(line):
+        # The automaton reports all (overlapping) matches, ordered by their end. Like the regular expression,
+        # replace the leftmost match first and prefer the longest key if several keys match at the same position.
+        matches = sorted(
+            (end + 1 - length, -length, value)
+            for end, (length, value) in automaton.iter(line.decode('latin-1'))
+        )
+        anonymised_line = bytearray()
+        position = 0
+        for start, negative_length, value in matches:
+            if start >= position:
+                anonymised_line += line[position:start]
+                anonymised_line += value
+                position = start - negative_length
+        anonymised_line += line[position:]
+        return bytes(anonymised_line)
+
+    return replace
+
+
 def anonymise(file, usernames, cluster_prefixes):
     '''Anonymise a file by replacing all usernames and cluster prefixes by anonymised versions.'''
-    with open(file, 'rb') as file_handle:
-        contents = file_handle.read()
-
-    for username, username_anon in generate_anonymised_usernames(usernames).items():
-        contents = contents.replace(username, username_anon)
-
-    for cluster_prefix, cluster_prefix_anon in generate_anonymised_cluster_prefixes(cluster_prefixes).items():
-        contents = contents.replace(cluster_prefix + b'-', cluster_prefix_anon + b'-')
-
-    # For the scontrol dump, let's remove other fields containing possibly sensitive information (e.g. kernel versions).
-    if file == SCONTROL_FILE:
-        contents = b'\n'.join([b' '.join(groups) for groups in re.findall(rb'(NodeName=\S+) .* (CfgTRES=\S+) .*', contents)])
-
-    # For sacct, we also remove the name of the job.
-    if file == SACCT_FILE:
-        sacct_lines = contents.strip().split(b'\n')
-        sacct_lines_anon = []
-        for line in sacct_lines:
-            columns = line.split(SACCT_SEPARATOR)
-            if columns[SACCT_JOBNAME_COLUMN] and columns[SACCT_JOBNAME_COLUMN] != b'batch':
-                columns[SACCT_JOBNAME_COLUMN] = random_job_name()
-            sacct_lines_anon.append(SACCT_SEPARATOR.join(columns))
-        contents = b'\n'.join(sacct_lines_anon)
+    replace_usernames = make_replacer(generate_anonymised_usernames(usernames))
+    replace_cluster_prefixes = make_replacer({
+        cluster_prefix + b'-': cluster_prefix_anon + b'-'
+        for cluster_prefix, cluster_prefix_anon in generate_anonymised_cluster_prefixes(cluster_prefixes).items()
+    })
+
+    # Process the file line by line and stream the anonymised contents to a new file.
+    with open(file, 'rb') as file_handle, open(file + '.anon', 'wb') as anon_file_handle:
+        separator = b''
+        for line in file_handle:
+            line = replace_cluster_prefixes(replace_usernames(line))
+
+            # For the scontrol dump, let's remove other fields containing possibly sensitive information (e.g. kernel versions).
+            if file == SCONTROL_FILE:
+                fields = line.split()
+                cfgtres = [field for field in fields if field.startswith(b'CfgTRES=')]
+                if not line.startswith(b'NodeName=') or not cfgtres:
+                    continue
+                line = fields[0] + b' ' + cfgtres[0]
+
+            # For sacct, we also remove the name of the job.
+            elif file == SACCT_FILE:
+                line = line.rstrip(b'\n')
+                if not line:
+                    continue
+                columns = line.split(SACCT_SEPARATOR)
+                if columns[SACCT_JOBNAME_COLUMN] and columns[SACCT_JOBNAME_COLUMN] != b'batch':
+                    columns[SACCT_JOBNAME_COLUMN] = random_job_name()
+                line = SACCT_SEPARATOR.join(columns)
+
+            else:
+                anon_file_handle.write(line)
+                continue
+
+            # The rewritten scontrol and sacct lines are separated by newlines, without a trailing one.
+            anon_file_handle.write(separator + line)
+            separator = b'\n'
 
     # Rename the original file...
     os.rename(file, file + '.orig')
 
-    # and write the new file with anonymised contents.
-    with open(file, 'wb') as file_handle:
-        file_handle.write(contents)
+    # and move the new file with anonymised contents into place.
+    os.rename(file + '.anon', file)
 
 
 def main():
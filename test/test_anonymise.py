@@ -0,0 +1,90 @@
+import random
+import pytest
+
+# Loaded from the repository root by conftest.py.
+import anonymise
+
+
+def random_word(rng, alphabet=b'ab-'):
+    '''Return a short random word; the small alphabet makes overlapping keys likely.'''
+    return bytes(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+
+
+@pytest.fixture
+def without_automaton(monkeypatch):
+    '''Use the regular expression replacer, even if pyahocorasick is installed.'''
+    monkeypatch.setattr(anonymise, 'ahocorasick', None)
+
+
+@pytest.mark.parametrize(
+    'line, expected',
+    [
+        (b'no keys here\n', b'no keys here\n'),
+        # The longest key wins if several keys match at the same position
+        (b'abc ab b\n', b'Y X Z\n'),
+        (b'abcab\n', b'YX\n'),
+    ]
+)
+def test_make_replacer(line, expected, without_automaton):
+    replace = anonymise.make_replacer({b'ab': b'X', b'abc': b'Y', b'b': b'Z'})
+    assert replace(line) == expected
+
+
+def test_make_replacer_without_replacements(without_automaton):
+    assert anonymise.make_replacer({})(b'ab\n') == b'ab\n'
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_automaton_replacer_matches_regex_replacer(seed, monkeypatch):
+    '''Both replacers should prefer the leftmost and then the longest key.'''
+    # The Aho-Corasick replacer is only used if pyahocorasick is installed.
+    pytest.importorskip('ahocorasick')
+    rng = random.Random(seed)
+    replacements = {random_word(rng): random_word(rng, b'XYZ') for _ in range(rng.randint(1, 8))}
+    lines = [b''.join(random_word(rng) for _ in range(rng.randint(1, 10))) + b'\xe2\x98\x83\n' for _ in range(50)]
+
+    replace_automaton = anonymise.make_automaton_replacer(replacements)
+    monkeypatch.setattr(anonymise, 'ahocorasick', None)
+    replace_regex = anonymise.make_replacer(replacements)
+
+    for line in lines:
+        assert replace_automaton(line) == replace_regex(line)
+
+
+# Original data dumps for test_main and their expected anonymised contents.
+SNOWMAN = b'\xe2\x98\x83'
+ORIGINAL_FILES = {
+    anonymise.SACCT_FILE: SNOWMAN.join([b'123', b'myjob', b'alice', b'peregrine-node1']) + b'\n' +
+    SNOWMAN.join([b'123.batch', b'batch', b'', b'peregrine-node1']) + b'\n\n',
+    anonymise.SCONTROL_FILE: b'NodeName=peregrine-node1 Arch=x86_64 OS=Linux 5.4 '
+    b'CfgTRES=cpu=24,mem=128500M,billing=24 Owner=alice\n'
+    b'this line is not about a node\n',
+    anonymise.SSTAT_FILE: b'123.batch|1|alice|peregrine-node1\n',
+    anonymise.SQUEUE_FILE: b'123|(null);(Priority)\n',
+}
+ANONYMISED_FILES = {
+    # The job name is replaced, the empty line is dropped, and there is no trailing newline.
+    anonymise.SACCT_FILE: SNOWMAN.join([b'123', b'JOBNAME', b'user1', b'mycluster1-node1']) + b'\n' +
+    SNOWMAN.join([b'123.batch', b'batch', b'', b'mycluster1-node1']),
+    # Only the node name and CfgTRES fields of node lines are kept.
+    anonymise.SCONTROL_FILE: b'NodeName=mycluster1-node1 CfgTRES=cpu=24,mem=128500M,billing=24',
+    # Other files are only rewritten, and keep their line endings.
+    anonymise.SSTAT_FILE: b'123.batch|1|user1|mycluster1-node1\n',
+    anonymise.SQUEUE_FILE: b'123|(null);(Priority)\n',
+}
+
+
+def test_main(tmp_path, monkeypatch, without_automaton):
+    '''Anonymise a copy of all data files in a temporary directory.'''
+    for filename, contents in ORIGINAL_FILES.items():
+        (tmp_path / filename).write_bytes(contents)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(anonymise, 'random_job_name', lambda: b'JOBNAME')
+
+    anonymise.main()
+
+    for filename, contents in ANONYMISED_FILES.items():
+        assert (tmp_path / filename).read_bytes() == contents
+        # The original file is kept as a backup.
+        assert (tmp_path / (filename + '.orig')).read_bytes() == ORIGINAL_FILES[filename]
+    assert not list(tmp_path.glob('*.anon'))
@@ -1,33 +1,43 @@
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 
-import importlib
+import contextlib
+import functools
 import io
 import os
-import re
+import pathlib
 import pytest
 
+# Loaded from the repository root by conftest.py.
+import jobinfo
+
 
 # Location of test script
 test_script_dir = os.path.dirname(os.path.realpath(__file__))
 
 # Directory that contains the input files for the tests.
 DATA_DIR = os.path.join(test_script_dir, 'data')
-# Filenames of the input files.
-SACCT_FILE = 'sacct.txt'
-SSTAT_FILE = 'sstat.txt'
-SQUEUE_FILE = 'squeue.txt'
-SCONTROL_FILE = 'scontrol.txt'
-
-# This is not a proper module, so use importlib to load the sources.
-pynumparser_loader = importlib.machinery.SourceFileLoader(
-    'pynumparser', os.path.join(test_script_dir, '../pynumparser.py')
-)
-pynumparser = pynumparser_loader.load_module()
+# Paths of the input files.
+SACCT_PATH = os.path.join(DATA_DIR, 'sacct.txt')
+SSTAT_PATH = os.path.join(DATA_DIR, 'sstat.txt')
+SQUEUE_PATH = os.path.join(DATA_DIR, 'squeue.txt')
+SCONTROL_PATH = os.path.join(DATA_DIR, 'scontrol.txt')
+
+# Field separator of the sacct output: a UTF-8 encoded snowman.
+SNOWMAN = b'\xe2\x98\x83'
+
+
+@functools.lru_cache(maxsize=None)
+def read_data_file(path):
+    '''Read the contents of an input file; every file is only read once per test session.'''
+    # the files are small, so read them in one go
+    return pathlib.Path(path).read_bytes()
+
+
+@functools.lru_cache(maxsize=None)
+def read_data_lines(path):
+    '''Return the lines (including line endings) of an input file.'''
+    return tuple(read_data_file(path).splitlines(keepends=True))
 
-jobinfo_loader = importlib.machinery.SourceFileLoader(
-    'jobinfo', os.path.join(test_script_dir, '../jobinfo')
-)
-jobinfo = jobinfo_loader.load_module()
 
 # Structure to represent return values for subprocess and requests calls.
 Subprocess = namedtuple('Subprocess', ['stdout'])
@@ -78,84 +88,139 @@ CPU_HINTS = [
     "The program efficiency is low. Your program is not using the assigned cores",
 ]
 MEMORY_HINT = "You requested much more memory than your program used."
+ALL_HINTS = frozenset(CPU_HINTS + [MEMORY_HINT])
 
 
-def sacct_output(jobid):
-    '''Mock call to sacct by reading from a file.'''
+@functools.lru_cache(maxsize=None)
+def build_sacct_index():
+    '''
+    Group the lines of the sacct file by job id in a single pass.
+    This index is used both to parametrize test_jobinfo and by the sacct mock.
+    '''
+    index = defaultdict(list)
+    for line in read_data_lines(SACCT_PATH):
+        index[line.partition(SNOWMAN)[0].partition(b'.')[0]].append(line)
+    return index
 
-    with open(os.path.join(DATA_DIR, SACCT_FILE), 'rb') as sacct_file:
-        sacct_lines = sacct_file.readlines()
-    jobid_lines = [
-        line for line in sacct_lines if line.split(b'\xe2\x98\x83')[0].split(b'.')[0] == jobid
-    ]
-    return Subprocess(stdout=jobid_lines)
 
+def prometheus_response(values):
+    '''Mock response of Prometheus for the given GPU usage samples.'''
+    return Request(content=b'{"data":{"result":[{"values":' + values + b'}]}}')
+
+
+def sacct_output(sacct_index, jobid):
+    '''Mock call to sacct by reading from a file.'''
+    return Subprocess(stdout=sacct_index.get(jobid, []))
 
-def squeue_output(jobid):
-    '''Mock call to squeue by reading from a file.'''
-    with open(os.path.join(DATA_DIR, SQUEUE_FILE), 'r') as squeue_file:
-        squeue_lines = squeue_file.read()
 
-    squeue_line = re.search(f'{jobid}.*\n', squeue_lines).group(0).strip().split('|', 1)[1]
-    print(squeue_lines)
+def squeue_output(squeue_index, jobid):
+    '''Mock call to squeue by reading from a file.'''
+    squeue_line = squeue_index[jobid]
     return Subprocess(stdout=io.BytesIO(squeue_line.encode('UTF-8')))
 
 
-def sstat_output(jobid):
+def sstat_output(sstat_index, jobid):
     '''Mock call to sstat by reading from a file.'''
-    with open(os.path.join(DATA_DIR, SSTAT_FILE), 'rb') as sstat_file:
-        sstat_lines = sstat_file.readlines()
-
-    jobid_lines = [
-        line for line in sstat_lines
-        # only select lines for which the first field matches jobid or jobid.batch
-        if line.split(b'|')[0].decode() in jobid.split(',')]
+    # only select lines for which the first field matches jobid or jobid.batch
+    jobid_lines = [line for step in jobid.encode().split(b',') for line in sstat_index.get(step, [])]
     return Subprocess(stdout=jobid_lines)
 
 
-def scontrol_show_nodes_output(node):
+def scontrol_show_nodes_output(scontrol_index, node):
     '''Mock call to scontrol by reading from a file.'''
-    with open(os.path.join(DATA_DIR, SCONTROL_FILE), 'r') as nodes_file:
-        nodes_lines = nodes_file.read()
-    node_line = re.search(f'NodeName={node}.*\n', nodes_lines).group(0).strip().encode('UTF-8')
+    node_line = scontrol_index.get(node)
+    if node_line is None:
+        # Fall back to the first node whose name starts with the given one,
+        # e.g. the test jobs without a node name get the first node.
+        node_line = next((line for name, line in scontrol_index.items() if name.startswith(node)), None)
+        if node_line is None:
+            raise KeyError('Node {} not found in {}'.format(node, SCONTROL_PATH))
     return Subprocess(stdout=io.BytesIO(node_line))
 
 
-def popen_side_effect(*args, **kwargs):
+@pytest.fixture(scope='session')
+def sacct_index():
+    '''Lines of the sacct file per job id.'''
+    return build_sacct_index()
+
+
+@pytest.fixture(scope='session')
+def squeue_index():
+    '''Output line of the squeue file per job id.'''
+    return dict(line.split('|', 1) for line in read_data_file(SQUEUE_PATH).decode('UTF-8').splitlines())
+
+
+@pytest.fixture(scope='session')
+def sstat_index():
+    '''Lines of the sstat file per job step id.'''
+    index = defaultdict(list)
+    for line in read_data_lines(SSTAT_PATH):
+        index[line.partition(b'|')[0]].append(line)
+    return index
+
+
+@pytest.fixture(scope='session')
+def scontrol_index():
+    '''Line of the scontrol file per node name.'''
+    return {
+        line.split(None, 1)[0][len(b'NodeName='):].decode(): line.strip()
+        for line in read_data_lines(SCONTROL_PATH)
+        if line.startswith(b'NodeName=')
+    }
+
+
+@pytest.fixture(scope='session')
+def popen_side_effect(sacct_index, squeue_index, sstat_index, scontrol_index):
     '''
     Side effect function for mocking the call to subprocess.Popen.
     Depending on what Popen is calling, we redirect to the right function.
     '''
-    popen_args = list(args[0])
-    if popen_args[0] == b'sacct':
-        return sacct_output(popen_args[-1])
-    elif popen_args[0] == 'scontrol':
-        return scontrol_show_nodes_output(popen_args[-1])
-    elif popen_args[0] == 'squeue':
-        return squeue_output(popen_args[-1])
-    elif popen_args[0] == 'sstat':
-        return sstat_output(popen_args[-1])
+    # Mock function for each command that jobinfo calls.
+    outputs = {
+        b'sacct': functools.partial(sacct_output, sacct_index),
+        b'scontrol': functools.partial(scontrol_show_nodes_output, scontrol_index),
+        b'squeue': functools.partial(squeue_output, squeue_index),
+        b'sstat': functools.partial(sstat_output, sstat_index),
+    }
+
+    def side_effect(*args, **kwargs):
+        popen_args = list(args[0])
+        # sacct is called with bytes arguments, the other commands with strings
+        command = popen_args[0]
+        if isinstance(command, str):
+            command = command.encode()
+        return outputs[command](popen_args[-1])
+
+    return side_effect
 
 
 def find_all_jobids():
     '''Find all our test job ids in the sacct.txt file.'''
-    jobids = []
-    with open(os.path.join(DATA_DIR, SACCT_FILE), 'rb') as sacct_file:
-        sacct = sacct_file.readlines()
-        jobids = [line.split(b'\xe2\x98\x83', 1)[0].split(b'.')[0].decode() for line in sacct]
-    # convert to set to remove duplicates
-    return set(jobids)
+    # the keys of the index are already unique; sort them for a deterministic test order
+    return tuple(sorted(jobid.decode() for jobid in build_sacct_index()))
 
 
-@pytest.mark.parametrize('jobid', find_all_jobids())
-def test_jobinfo(jobid, mocker):
-    '''Test jobinfo on a given jobid.'''
+@pytest.fixture
+def patched_subprocess(mocker, popen_side_effect):
+    '''Redirect the SLURM commands to the test data files.'''
     mocker.patch('subprocess.Popen', side_effect=popen_side_effect)
+
+
+@pytest.fixture
+def patched_root(mocker):
+    '''Run as root, so that jobinfo also shows the live values of jobs of other users.'''
     mocker.patch('os.getuid', return_value=0)
-    mocker.patch(
-        'requests.get',
-        return_value=Request(content=b'{"data":{"result":[{"values":' + GPU_USAGE_VALUES + b'}]}}')
-    )
+
+
+@pytest.fixture
+def patched_requests(mocker):
+    '''Return the default GPU usage values for calls to Prometheus.'''
+    mocker.patch('requests.get', return_value=prometheus_response(GPU_USAGE_VALUES))
+
+
+@pytest.mark.parametrize('jobid', find_all_jobids())
+def test_jobinfo(jobid, patched_subprocess, patched_root, patched_requests):
+    '''Test jobinfo on a given jobid.'''
     jobinfo.main(jobid)
 
 
@@ -182,74 +247,85 @@ def test_parse_gpu_string(test_input, expected):
     ]
 )
 def test_get_gpu_usage(gpu_usage_samples, expected_total_usage, mocker):
-    ret_value_content = b'{"data":{"result":[{"values":' + gpu_usage_samples + b'}]}}'
-    mocker.patch('requests.get', return_value=Request(content=ret_value_content))
+    mocker.patch('requests.get', return_value=prometheus_response(gpu_usage_samples))
     assert jobinfo.get_gpu_usage('dummy', 'start', 'end') == expected_total_usage
 
 
 def test_get_gpus_usage(mocker):
     usage1 = b'[[0, 0], [1, 100], [2, 100], [3, 0]]' # 50%
-    ret_value_content = b'{"data":{"result":[{"values":' + usage1 + b'}]}}'
-    mocker.patch('requests.get', return_value=Request(content=ret_value_content))
+    mocker.patch('requests.get', return_value=prometheus_response(usage1))
     expected = [('my-gpu01', 50), ('my-gpu02', 50)]
     assert jobinfo.get_gpus_usage('my-gpu[01-02]', 'start', 'end') == expected
 
 
 @pytest.mark.parametrize(
-    'job_fields, expected_hints',
+    'scontrol_line, expected_cpus',
+    [
+        (b'   CfgTRES=cpu=24,mem=128500M,billing=24', 24),
+        # Default to a single CPU if scontrol does not report any
+        (b'', 1),
+    ]
+)
+def test_get_cpus_node(scontrol_line, expected_cpus, mocker):
+    popen = mocker.patch('subprocess.Popen', return_value=Subprocess(stdout=io.BytesIO(scontrol_line)))
+    assert jobinfo.get_cpus_node('node1,node2') == expected_cpus
+    # Only the last node of the list is queried
+    assert popen.call_args[0][0][-1] == 'node2'
+
+
+@pytest.mark.parametrize(
+    'mytestjob, expected_hints',
     [
         # No hints for jobs without an end time
-        ({'end': 'UNKNOWN'}, []),
+        (testjob._replace(end='UNKNOWN'), []),
         # No hints for short jobs or ones without CPU time
-        ({'elapsed': '00:01:00'}, []),
-        ({'TotalCPU': '00:00:00'}, []),
+        (testjob._replace(elapsed='00:01:00'), []),
+        (testjob._replace(TotalCPU='00:00:00'), []),
         # No hints for GPU jobs
-        ({'Partition': 'gpu'}, []),
+        (testjob._replace(Partition='gpu'), []),
         # Set memory usage to a very low value
-        ({'TRESUsageInTot': (100*1024**2, 0), 'ReqMem': '10Gc'}, [MEMORY_HINT]),
+        (testjob._replace(TRESUsageInTot=(100*1024**2, 0), ReqMem='10Gc'), [MEMORY_HINT]),
         # Request 4x4 GB in total, only use 8 GB: violates the total and per-core threshold
-        ({'ncpus': 4, 'ReqMem': '4Gc', 'TRESUsageInTot': (8*1024**3, 0)}, [MEMORY_HINT]),
+        (testjob._replace(ncpus=4, ReqMem='4Gc', TRESUsageInTot=(8*1024**3, 0)), [MEMORY_HINT]),
         # Request 4x4 GB in total, only use 11 GB: violates only the total threshold
-        ({'ncpus': 4, 'ReqMem': '4Gc', 'TRESUsageInTot': (11*1024**3, 0)}, []),
+        (testjob._replace(ncpus=4, ReqMem='4Gc', TRESUsageInTot=(11*1024**3, 0)), []),
         # Request 1 core, but only use it for 70%
-        ({'ncpus': 1, 'elapsed': '01:00:00', 'TotalCPU': '00:30:00'}, [CPU_HINTS[0]]),
+        (testjob._replace(ncpus=1, elapsed='01:00:00', TotalCPU='00:30:00'), [CPU_HINTS[0]]),
         # Request 10 core, but only use one (10%)
-        ({'ncpus': 10, 'elapsed': '01:00:00', 'TotalCPU': '01:00:00'}, [CPU_HINTS[1]]),
+        (testjob._replace(ncpus=10, elapsed='01:00:00', TotalCPU='01:00:00'), [CPU_HINTS[1]]),
         # Request 10 core, but only use them about half of the time
-        ({'ncpus': 10, 'elapsed': '01:00:00', 'TotalCPU': '05:00:00'}, [CPU_HINTS[2]]),
+        (testjob._replace(ncpus=10, elapsed='01:00:00', TotalCPU='05:00:00'), [CPU_HINTS[2]]),
         # Test some combinations of CPU and memory hints
         (
-            {
-                'TRESUsageInTot': (100*1024**2, 0), 'ReqMem': '10Gc',
-                'ncpus': 1, 'elapsed': '01:00:00', 'TotalCPU': '00:30:00'
-            },
+            testjob._replace(
+                TRESUsageInTot=(100*1024**2, 0), ReqMem='10Gc',
+                ncpus=1, elapsed='01:00:00', TotalCPU='00:30:00'
+            ),
             [MEMORY_HINT, CPU_HINTS[0]]
         ),
         (
-            {
-                'ncpus': 4, 'ReqMem': '4Gc', 'TRESUsageInTot': (8*1024**3, 0),
-                'elapsed': '01:00:00', 'TotalCPU': '01:00:00'
-            },
+            testjob._replace(
+                ncpus=4, ReqMem='4Gc', TRESUsageInTot=(8*1024**3, 0),
+                elapsed='01:00:00', TotalCPU='01:00:00'
+            ),
             [MEMORY_HINT, CPU_HINTS[1]]
         ),
         (
-            {
-                'TRESUsageInTot': (100*1024**2, 0), 'ReqMem': '10Gc', 'ncpus': 10,
-                'elapsed': '01:00:00', 'TotalCPU': '05:00:00'
-            },
+            testjob._replace(
+                TRESUsageInTot=(100*1024**2, 0), ReqMem='10Gc', ncpus=10,
+                elapsed='01:00:00', TotalCPU='05:00:00'
+            ),
             [MEMORY_HINT, CPU_HINTS[2]]
         ),
     ],
 )
-def test_hints(job_fields, expected_hints, mocker, capfd):
-    mocker.patch('subprocess.Popen', side_effect=popen_side_effect)
-
-    mytestjob = testjob._replace(**job_fields)
-    jobinfo.get_hints(mytestjob)
-    stdout, stderr = capfd.readouterr()
+def test_hints(mytestjob, expected_hints, patched_subprocess):
+    # get_hints prints the hints, so collect its output in memory
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        jobinfo.get_hints(mytestjob)
+    stdout = output.getvalue()
     for hint in expected_hints:
         assert hint in stdout
 
-    non_expected_hints = set(CPU_HINTS + [MEMORY_HINT]).difference(expected_hints)
-    for hint in non_expected_hints:
+    for hint in ALL_HINTS.difference(expected_hints):
         assert hint not in stdout
@@ -0,0 +1,144 @@
+import pytest
+
+# Loaded from the repository root by conftest.py.
+import pynumparser
+
+
+@pytest.mark.parametrize(
+    'numtype, text, expected',
+    [
+        (int, '5', (5,)),
+        (int, '1,3,8', (1, 3, 8)),
+        (int, '8-10,30', (8, 9, 10, 30)),
+        (int, '5-30/5,100', (5, 10, 15, 20, 25, 30, 100)),
+        (int, '8,10+3', (8, 10, 11, 12, 13)),
+        (int, '10-40/17,1+2', (10, 27, 1, 2, 3)),
+        # Negative numbers, as LOWER and as UPPER
+        (int, '-5', (-5,)),
+        (int, '-3-5', (-3, -2, -1, 0, 1, 2, 3, 4, 5)),
+        (int, '-3--1', (-3, -2, -1)),
+        (int, '-20+10', tuple(range(-20, -9))),
+        # Signs in exponents are not separators
+        (float, '-2e+2+1e02', tuple(float(i) for i in range(-200, -99))),
+        (float, '1e-5-1.001e-5/1e-8', (1e-5, 1e-5 + 1e-8)),
+        # Uppercase exponent markers are accepted as well
+        (float, '1E-5', (1e-5,)),
+        (float, '-2E+2+1E0', (-200.0, -199.0)),
+    ]
+)
+def test_parse(numtype, text, expected):
+    parser = pynumparser.NumberSequence(numtype)
+    assert parser.parse(text) == pytest.approx(expected)
+    assert parser.error is None
+
+
+def test_parse_uppercase_exponent_upper():
+    # "1E+9" is the UPPER of this subsequence; check it without building the range.
+    parser = pynumparser.NumberSequence(float)
+    assert parser.contains('0-1E+9', (0, 5e8, 1e9, 1e9 + 1)) == (True, True, True, False)
+
+
+@pytest.mark.parametrize(
+    'numtype, text, number, expected',
+    [
+        (int, '0,10-20', 15, True),
+        (int, '0,10-20/2', 15, False),
+        (int, '0,10-20', 'x', False),
+        (float, '0-1/0.1', 0.3, True),
+        (float, '0-1/0.1', 0.35, False),
+        # A range so large that its quotient by the step overflows
+        (float, '0-1e300/1e-10', 3.3e299, False),
+        (float, '0-1e300/1e-10', 7e-10, True),
+    ]
+)
+def test_contains(numtype, text, number, expected):
+    assert pynumparser.NumberSequence(numtype).contains(text, number) is expected
+
+
+@pytest.mark.parametrize(
+    'numtype, limits, text, expected_error',
+    [
+        (int, None, '1,,2', 'Empty subsequence'),
+        (int, None, '5/2', 'Missing UPPER'),
+        (int, None, '1-5/x', 'Invalid STEP'),
+        # Only a single STEP is allowed
+        (int, None, '1-2/3/4', 'Invalid STEP'),
+        (int, None, '1-5/0', 'STEP must be positive'),
+        (int, None, '1-5/-1', 'STEP must be positive'),
+        (int, None, 'x-2', 'Invalid LOWER'),
+        (int, None, '5-1', 'UPPER<LOWER'),
+        (int, None, 'x', 'Parse Error'),
+        (float, None, 'inf', 'Infinite Value'),
+        (int, (0, 10), '-1-5', 'LOWER too small'),
+        (int, (0, 10), '5-11', 'UPPER too large'),
+        (int, (0, None), '-1', 'LOWER too small'),
+        (int, (None, 10), '11', 'UPPER too large'),
+    ]
+)
+def test_parse_error(numtype, limits, text, expected_error):
+    parser = pynumparser.NumberSequence(numtype, limits)
+    with pytest.raises(ValueError, match=expected_error):
+        parser.parse(text)
+    assert parser.error == expected_error
+
+
+def test_parse_cached():
+    parser = pynumparser.NumberSequence(int, (0, 100))
+    first = parser.parse('1-5,8')
+    assert first == (1, 2, 3, 4, 5, 8)
+    # A second parser with the same type and limits gets the cached result
+    assert pynumparser.NumberSequence(int, (0, 100)).parse('1-5,8') is first
+    # but other limits do not share it
+    with pytest.raises(ValueError):
+        pynumparser.NumberSequence(int, (0, 5)).parse('1-5,8')
+
+
+def test_parse_limits_changed_after_init():
+    parser = pynumparser.NumberSequence(int)
+    parser.highest = 10
+    with pytest.raises(ValueError, match='UPPER too large'):
+        parser.parse('1-20')
+    parser.highest = None
+    parser.lowest = 5
+    with pytest.raises(ValueError, match='LOWER too small'):
+        parser.parse('1-20')
+    # Results parsed with other limits must not leak through the cache
+    parser.lowest = None
+    assert parser.parse('1-20') == tuple(range(1, 21))
+    with pytest.raises(ValueError, match='UPPER too large'):
+        pynumparser.NumberSequence(int, (None, 10)).parse('1-20')
+
+
+def test_parse_cache_skips_large_results():
+    text = '1-{}'.format(pynumparser._PARSE_CACHE_MAX_LEN + 1)
+    assert len(pynumparser.NumberSequence(int).parse(text)) == pynumparser._PARSE_CACHE_MAX_LEN + 1
+    assert (int, None, None, text) not in pynumparser._parse_cache
+
+
+def test_parse_error_after_cache_hit():
+    parser = pynumparser.NumberSequence(int)
+    parser.parse('1-3')
+    with pytest.raises(ValueError):
+        parser.parse('3-1')
+    assert parser.error == 'UPPER<LOWER'
+    # A successful (cached) parse clears the error again
+    assert parser.parse('1-3') == (1, 2, 3)
+    assert parser.error is None
+
+
+@pytest.mark.parametrize(
+    'sequence, expected',
+    [
+        ((), ''),
+        ((3,), '3'),
+        ((5, 10, 15, 20, 25, 30, 100, 101, 102, 110), '5-30/5,100-102,110'),
+        # Two-element runs are written as single numbers, except for the final run
+        ((1, 2, 3, 7, 8, 10), '1-3,7,8,10'),
+        ((1, 2, 3, 7, 8), '1-3,7-8'),
+        # Repeated values
+        ((4, 4, 4), '4,4,4'),
+        ((1, 1, 2, 2), '1,1,2,2'),
+    ]
+)
+def test_encode(sequence, expected):
+    assert pynumparser.NumberSequence.encode(sequence) == expected